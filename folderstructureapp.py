@@ -1,20 +1,205 @@
 import os
+import re
 import json
+import orjson
 import zipfile
-import tempfile
+import hashlib
+import shelve
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import streamlit as st
 from dotenv import load_dotenv
 from pathlib import Path
 from io import BytesIO
-from jsonschema import validate
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+    from jsonschema.validators import validator_for
 from datetime import datetime, timedelta
 import time
-
-chat_history = [
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+MAX_WORKERS = 16
+SCRIPT_WORKERS = 10
+MAX_IN_FLIGHT_LLM_CALLS = 16
+SCRIPT_BATCH_SIZE = 8
+SCRIPT_BATCH_MAX_CHARS = 24000
+RETRY_BATCH_SIZE = 4
+RETRY_BATCH_MAX_CHARS = 24000
+SCHEMA_PATH = "postman_collection_v2.2_schema.json"
+V21_SCHEMA_URI = "https://schema.getpostman.com/json/collection/v2.1.0/collection.json"
+V22_SCHEMA_MARKER = b"v2.2.0/collection.json"
+V22_MARKER_SCAN_CHARS = 2048
+LLM_CACHE_DIR = ".llm_cache"
+LLM_CACHE_PATH = os.path.join(LLM_CACHE_DIR, "responses")
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+SCRIPT_CACHE_PATH = os.path.join(LLM_CACHE_DIR, "scripts")
+converted_scripts = {}
+ZIP_STORE_MAX_BYTES = 4 * 1024
+PROGRESS_UPDATE_INTERVAL = 0.25
+LLM_CONNECT_TIMEOUT = 5
+SCRIPT_LLM_TIMEOUT = 300
+COLLECTION_LLM_TIMEOUT = 180
+SCRIPT_LLM_MODEL = "gpt-4.1-mini"
+LLM_MIN_READ_TIMEOUT = 60
+LLM_TIMEOUT_HEADROOM = 2
+LLM_MIN_LATENCY_SAMPLES = 20
+LLM_LATENCIES_LOCK = threading.Lock()
+# Keyed by call kind ("script", "batch", "fix", "collection", "collection_batch"), so each gets its own p90.
+llm_latencies = defaultdict(lambda: deque(maxlen=200))
+os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+
+LEGACY_RE = re.compile(
+    r"(?<![\w.])(?:tests\[|responseBody\b|responseCode\b|responseHeaders\b|responseTime\b|"
+    r"responseCookies\b|postman\.\w|environment\.|globals\.|xml2Json\b)"
+)
+COMMENT_RE = re.compile(r"//[^\n]*|/\*.*?(?:\*/|\Z)", re.S)
+STRING_OR_COMMENT_RE = re.compile(
+    r"""'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`|//[^\n]*|/\*.*?(?:\*/|\Z)""", re.S
+)
+LEGACY_TEST_RE = re.compile(r"^([ \t]*)tests\[(.+?)\]\s*=\s*(.+?);[ \t]*$", re.M)
+# Legacy tests[] passed on any truthy value, hence .to.be.ok rather than .to.be.true.
+LEGACY_TEST_REWRITE = "{}pm.test({}, function () {{ pm.expect({}).to.be.ok; }});"
+LEGACY_UNSUPPORTED_RE = re.compile(r"(?<![\w.])responseBody\s*\.\s*has\s*\(")
+LEGACY_REWRITES = [
+    (re.compile(r"(?<![\w.])JSON\.parse\(\s*responseBody\s*\)"), "pm.response.json()"),
+    (re.compile(r"(?<![\w.])responseBody\b"), "pm.response.text()"),
+    (re.compile(r"(?<![\w.])responseCode\.code\b"), "pm.response.code"),
+    (re.compile(r"(?<![\w.])responseTime\b"), "pm.response.responseTime"),
+    (re.compile(r"(?<![\w.])postman\.setEnvironmentVariable\("), "pm.environment.set("),
+    (re.compile(r"(?<![\w.])postman\.getEnvironmentVariable\("), "pm.environment.get("),
+    (re.compile(r"(?<![\w.])postman\.clearEnvironmentVariable\("), "pm.environment.unset("),
+    (re.compile(r"(?<![\w.])postman\.getGlobalVariable\("), "pm.globals.get("),
+]
+LEAD_RE = re.compile(r"^\s*(?:javascript|js)(?![\w$])[\s:]*", re.I)
+CLOSING_BRACKETS = {')': '(', '}': '{', ']': '['}
+BRACKET_TOKEN_RE = re.compile(r"[(){}\[\]'\"`/*\\\n]")
+FENCE_OPEN_RE = re.compile(r"\A```[\w-]*")
+TRANSIENT_LLM_ERRORS = (
+    requests.exceptions.RetryError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+)
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Auth failures hit every call alike, so there is no point converting the rest of the collection.
+GLOBAL_LLM_ERROR_STATUSES = (401, 403)
+
+@st.cache_resource
+def llm_transport():
+    # Streamlit re-executes this module on every rerun; build the pool and the in-flight cap once per process.
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=64,
+        max_retries=Retry(
+            total=3,
+            read=2,
+            backoff_factor=2,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset(["GET", "POST"]),
+        ),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session, threading.BoundedSemaphore(MAX_IN_FLIGHT_LLM_CALLS)
+
+SESSION, LLM_SLOTS = llm_transport()
+
+@st.cache_resource
+def llm_cache_lock():
+    # Every rerun and session opens the same shelve files, so they must share one lock.
+    return threading.Lock()
+
+LLM_CACHE_LOCK = llm_cache_lock()
+
+SYSTEM_MESSAGES = [
     {"role": "system", "content": "You are a Postman script conversion expert that follows specific conversion rules exactly. Never add extra code or comments."}
 ]
 
+def post_llm(payload, timeout, kind, accept=None):
+    # Only replies the caller's accept() check passes are cached; repair and retry calls pass none.
+    key = hashlib.sha256(
+        f"{payload['model']}\0{payload['systemprompt']}\0{payload['userprompt']}".encode("utf-8")
+    ).hexdigest()
+    if accept:
+        with LLM_CACHE_LOCK, shelve.open(LLM_CACHE_PATH) as cache:
+            cached = cache.get(key)
+        if cached and time.time() - cached[0] < LLM_CACHE_TTL_SECONDS:
+            return cached[1]
+    read_timeout = llm_read_timeout(kind, timeout)
+    with LLM_SLOTS:
+        started = time.perf_counter()
+        try:
+            response = SESSION.post(api_url, data=orjson.dumps(payload), headers=JSON_HEADERS, timeout=(LLM_CONNECT_TIMEOUT, read_timeout))
+        except requests.exceptions.RequestException:
+            # Count calls that ran out the clock at the cap; otherwise the p90 only sees calls
+            # that beat the current timeout and keeps ratcheting it down.
+            if time.perf_counter() - started >= read_timeout:
+                with LLM_LATENCIES_LOCK:
+                    llm_latencies[kind].append(read_timeout)
+            raise
+        latency = time.perf_counter() - started
+    response.raise_for_status()
+    with LLM_LATENCIES_LOCK:
+        llm_latencies[kind].append(latency)
+    if accept and accept(response.text):
+        with LLM_CACHE_LOCK, shelve.open(LLM_CACHE_PATH) as cache:
+            cache[key] = (time.time(), response.text)
+    return response.text
+
+def llm_read_timeout(kind, max_timeout):
+    with LLM_LATENCIES_LOCK:
+        samples = sorted(llm_latencies[kind])
+    if len(samples) < LLM_MIN_LATENCY_SAMPLES:
+        return max_timeout
+    p90 = samples[int(len(samples) * 0.9)]
+    return min(max_timeout, max(LLM_MIN_READ_TIMEOUT, p90 * LLM_TIMEOUT_HEADROOM))
+
+def strip_fences(text):
+    text = FENCE_OPEN_RE.sub("", text.strip(), count=1).removesuffix("```").strip()
+    return LEAD_RE.sub("", text, count=1)
+
+def salvage_partial_json(text, expected_len):
+    try:
+        items = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        items = []
+        pos = text.find("[") + 1
+        if pos == 0:
+            raise ValueError("No JSON array found in the response")
+        decoder = json.JSONDecoder()
+        while True:
+            while pos < len(text) and text[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(text) or text[pos] == "]" or len(items) >= expected_len:
+                break
+            try:
+                item, pos = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break
+            items.append(item)
+        if pos >= len(text) or text[pos] != "]":
+            items += [None] * (expected_len - len(items))
+    if not isinstance(items, list) or len(items) != expected_len:
+        raise ValueError(f"Expected a JSON array of {expected_len} elements in the response")
+    return items
+
+def batched(items, max_items, max_chars, size=len):
+    batch, batch_chars = [], 0
+    for item in items:
+        item_chars = size(item)
+        if batch and (len(batch) >= max_items or batch_chars + item_chars > max_chars):
+            yield batch
+            batch, batch_chars = [], 0
+        batch.append(item)
+        batch_chars += item_chars
+    if batch:
+        yield batch
+
 def split_script(script, max_lines=100):
     lines = script.splitlines()
     for i in range(0, len(lines), max_lines):
@@ -22,11 +207,42 @@ def split_script(script, max_lines=100):
 
 
 def validate_as_v22_but_save_as_v21(obj):
-    if "info" not in obj:
-        obj["info"] = {}
-    obj["info"]["schema"] = "https://schema.getpostman.com/json/collection/v2.2.0/collection.json"
-    validate(instance=obj, schema=schema)
-    obj["info"]["schema"] = "https://schema.getpostman.com/json/collection/v2.1.0/collection.json"
+    obj.setdefault("info", {})["schema"] = V21_SCHEMA_URI
+    validate_collection(obj)
+
+def is_already_v22(raw, collection_json):
+    if V22_SCHEMA_MARKER not in raw[:V22_MARKER_SCAN_CHARS]:
+        return False
+    try:
+        validate_as_v22_but_save_as_v21(collection_json)
+    except Exception:
+        return False
+    return True
+
+def inline_schema_refs(node, definitions, expanding=()):
+    if isinstance(node, list):
+        return [inline_schema_refs(value, definitions, expanding) for value in node]
+    if not isinstance(node, dict):
+        return node
+    ref = node.get("$ref")
+    if len(node) == 1 and isinstance(ref, str) and ref.startswith("#/definitions/"):
+        name = ref[len("#/definitions/"):]
+        if name in definitions and name not in expanding:
+            return inline_schema_refs(definitions[name], definitions, expanding + (name,))
+        return node
+    return {key: inline_schema_refs(value, definitions, expanding) for key, value in node.items()}
+
+@st.cache_resource
+def load_validator(path, mtime):
+    with open(path, "rb") as f:
+        schema = orjson.loads(f.read())
+    schema["properties"]["info"]["properties"]["schema"]["pattern"] = f"^{re.escape(V21_SCHEMA_URI)}$"
+    if fastjsonschema is not None:
+        return fastjsonschema.compile(schema)
+    schema = inline_schema_refs(schema, schema.get("definitions", {}))
+    validator_cls = validator_for(schema)
+    validator_cls.check_schema(schema)
+    return validator_cls(schema).validate
 
 
 load_dotenv()
@@ -36,13 +252,10 @@ if not api_url or not api_url.strip():
     st.error("AZURE_URL is not set in your .env file or is empty. Please check your .env configuration.")
     st.stop()
 
-schema = None
 try:
-    with open("postman_collection_v2.2_schema.json", "r", encoding="utf-8") as f:
-        schema = json.load(f)
-    st.warning("Loaded Postman v2.2 schema from local fallback.")
-except Exception as fallback_error:
-    st.error(f"Failed to load Postman schema.\n\nError: {fallback_error}")
+    validate_collection = load_validator(SCHEMA_PATH, os.path.getmtime(SCHEMA_PATH))
+except Exception as schema_error:
+    st.error(f"Failed to load Postman schema.\n\nError: {schema_error}")
     st.stop()
 
 st.set_page_config(page_title="Postman Bulk Converter")
@@ -51,37 +264,11 @@ st.title("Convert All Postman JSONs from a Zipped Folder")
 uploaded_zip = st.file_uploader("Upload a zipped folder of Postman collections (.zip)", type="zip")
 
 
-def generate_script_v22(old_script, type):
-    prompt = f'''
-<|system|>
-You are a helpful assistant who is better than Postman's Postbot AI which fixes and converts old Postman scripts from legacy format (v2.1.0) to the modern format (v2.2.0). Retain the version as v2.1.0 in the schema only. If the script is empty, leave it empty.
-
-<|user|>
-Convert the following Postman {type} script to modern syntax. Schema version should stay v2.1.0. If the following aren't followed properly, I will end up losing my job so please follow these.
-
-Instructions:
-1. Preserve the original test logic and assertions, but make necessary structural changes if the data type requires it (e.g., accessing array elements with [i] when a property is an array in the response).
-2. Understand the JSON structure from the older script and see how the properties are called and follow that same manner but with the new code.
-3. If the script is empty, return an empty string and if there are comments in the script, remove them do not change those lines to code.
-4. Do not add extra sample code or usage examples and **DO NOT** use any placeholders for a property like property_name or the words "javascript" or "js" or add comments in between the code.
-5. Return the full completed code with no syntax errors and same logic as the original script. If you see a const object which is a schema just retain it as it is.
-6. When using `pm.response.json()`, assign it to a variable named `response`, and assign `response.data || {{}}` to a variable named `nr`. Do **not** try to access `nr.data.property`, instead use `nr.property` — `nr` itself is already the `data` section.
-7. Never write `pm.expect(nr.data).to.have.property(...)` — that's incorrect. Use `pm.expect(nr).to.have.property(...)` instead. Also do not use `pm.expect(response.hasOwnProperty(...))` — use `pm.expect(nr.hasOwnProperty(...))` instead.
-8. Keep in mind that there is no function like `pm.response.json(...).has()`. Use `.hasOwnProperty(...)` safely.
-9. **DO NOT** give me a script which would lead to a "no tests found" error in Postman.
-10. Do not use `pm.response` inside Pre-request scripts.
-11. Preserve original test descriptions; do not reword test titles.
-12. Do not add any new functions or variables unless they existed in the original test or pre-request script.
-13. Do not use `JSON.parse(pm.response.json())` — `pm.response.json()` is already parsed.
-14. Do not use `pm.globals.get(...)` in Pre-request scripts and do not use `pm.globals.set(...)` in Test scripts unless the original script used them.
-15. If there is a schema which exists as a constant in the original script, do not make any changes to it. Just copy it as it is.
-### Response structure:
-Assume all scripts reference a JSON structure like this (from `pm.response.json()`) and use this JSON structure as the ground truth for typing and access logic:
-{{
+RESPONSE_SHAPE_JSON = '''{
   "code": 0,
   "message": "success",
-  "data": {{
-    "summary_details": {{
+  "data": {
+    "summary_details": {
       "down_count": 2,
       "downtime_duration": 120,
       "availability_percentage": 99.5,
@@ -100,14 +287,14 @@ Assume all scripts reference a JSON structure like this (from `pm.response.json(
       "trouble_percentage": 0.2,
       "trouble_count": 1,
       "trouble_duration": 70
-    }},
+    },
     "charts": [
-      {{
+      {
         "name": "Uptime Chart",
         "data_points": [...]
-      }}
+      }
     ],
-    "info": {{
+    "info": {
       "report_name": "Top N Report",
       "report_type": 15,
       "limit": 10,
@@ -121,41 +308,61 @@ Assume all scripts reference a JSON structure like this (from `pm.response.json(
       "period": "Last Month",
       "period_name": "June 2024",
       "monitor_type": "HOMEPAGE"
-    }},
+    },
     "availability_details": [
-      {{
+      {
         "monitor_id": 12345,
         "availability": 99.9
-      }}
+      }
     ],
     "outage_details": [
-      {{
+      {
         "monitor_id": 12345,
         "outages": [
-          {{
+          {
             "outage_id": "out123",
             "start_time": 1717500000000,
             "end_time": 1717500600000,
             "duration": 60,
             "type": "critical"
-          }}
+          }
         ]
-      }}
+      }
     ],
-    "profile_details": {{
+    "profile_details": {
       "profile_id": 987,
       "profile_name": "Critical Monitors"
-    }},
-    "performance_details": {{
-      "HOMEPAGE": {{
+    },
+    "performance_details": {
+      "HOMEPAGE": {
         "name": "Homepage Load",
         "attribute_data": [...],
         "availability": [...],
         "tags": ["web", "latency"]
-      }}
-    }}
-  }}
-}}
+      }
+    }
+  }
+}'''
+
+SCRIPT_CONVERSION_RULES = '''Instructions:
+1. Preserve the original test logic and assertions, but make necessary structural changes if the data type requires it (e.g., accessing array elements with [i] when a property is an array in the response).
+2. Understand the JSON structure from the older script and see how the properties are called and follow that same manner but with the new code.
+3. If the script is empty, return an empty string and if there are comments in the script, remove them do not change those lines to code.
+4. Do not add extra sample code or usage examples and **DO NOT** use any placeholders for a property like property_name or the words "javascript" or "js" or add comments in between the code.
+5. Return the full completed code with no syntax errors and same logic as the original script. If you see a const object which is a schema just retain it as it is.
+6. When using `pm.response.json()`, assign it to a variable named `response`, and assign `response.data || {}` to a variable named `nr`. Do **not** try to access `nr.data.property`, instead use `nr.property` — `nr` itself is already the `data` section.
+7. Never write `pm.expect(nr.data).to.have.property(...)` — that's incorrect. Use `pm.expect(nr).to.have.property(...)` instead. Also do not use `pm.expect(response.hasOwnProperty(...))` — use `pm.expect(nr.hasOwnProperty(...))` instead.
+8. Keep in mind that there is no function like `pm.response.json(...).has()`. Use `.hasOwnProperty(...)` safely.
+9. **DO NOT** give me a script which would lead to a "no tests found" error in Postman.
+10. Do not use `pm.response` inside Pre-request scripts.
+11. Preserve original test descriptions; do not reword test titles.
+12. Do not add any new functions or variables unless they existed in the original test or pre-request script.
+13. Do not use `JSON.parse(pm.response.json())` — `pm.response.json()` is already parsed.
+14. Do not use `pm.globals.get(...)` in Pre-request scripts and do not use `pm.globals.set(...)` in Test scripts unless the original script used them.
+15. If there is a schema which exists as a constant in the original script, do not make any changes to it. Just copy it as it is.
+### Response structure:
+Assume all scripts reference a JSON structure like this (from `pm.response.json()`) and use this JSON structure as the ground truth for typing and access logic:
+''' + RESPONSE_SHAPE_JSON + '''
 
 16. Use the structure above to correctly navigate nested properties. For example:
     - Based on the given response structure, ensure all array-based properties like availability_details, charts, outage_details are safely looped or accessed with indices, even if the original script treated them like objects.
@@ -175,32 +382,68 @@ Assume all scripts reference a JSON structure like this (from `pm.response.json(
 ### Global utilities:
 - If a global function is stored using `postman.setGlobalVariable('function_name', ...)`, convert it as follows:
   - For Pre-request scripts:  
-    `pm.globals.set(function_name, function_call() {{ ... }} + 'function_call()');`
+    `pm.globals.set(function_name, function_call() { ... } + 'function_call()');`
   - For Test scripts:
     let function_call = pm.globals.get("function_name");
     eval(function_call);
     function_name();
     Ensure `function_call` and `function_name` are different strings to avoid name collision also always call the function_name after eval.
 
-### Output:
-Return the converted script **as plain JavaScript only**, with no additional comments, markdown, or explanation.
+'''
 
-{old_script}
+SCRIPT_SYSTEM_PROMPT = f'''You are a helpful assistant who is better than Postman's Postbot AI which fixes and converts old Postman scripts from legacy format (v2.1.0) to the modern format (v2.2.0). Retain the version as v2.1.0 in the schema only. If a script is empty, leave it empty. If the following aren't followed properly, I will end up losing my job so please follow these.
+
+{SCRIPT_CONVERSION_RULES}'''
+
+SCRIPT_PROMPT_PREFIXES = {
+    script_type: f"Convert the following Postman {script_type} script to modern syntax. "
+    "Return the converted script **as plain JavaScript only**, with no additional comments, markdown, or explanation.\n\n"
+    for script_type in ("test", "prerequest")
+}
+
+def generate_script_v22(old_script, type):
+    prompt = SCRIPT_PROMPT_PREFIXES[type] + old_script + "\n"
+    payload = {
+        "systemprompt": SCRIPT_SYSTEM_PROMPT,
+        "userprompt": prompt,
+        "max_completion_tokens": 16000,
+        "temperature": 0.15,
+        "message": [{"role": "system", "content": SCRIPT_SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+        "model": SCRIPT_LLM_MODEL
+    }
+    def complete(text):
+        return not is_truncated(strip_fences(text))
+    return strip_fences(post_llm(payload, timeout=SCRIPT_LLM_TIMEOUT, kind="script", accept=complete))
+
+def generate_scripts_v22_batch(scripts):
+    inputs = "".join(
+        f"### INPUT {i} (type={script_type}) ###\n{script_text}\n"
+        for i, (script_text, script_type) in enumerate(scripts)
+    ) + "### END OF INPUTS ###"
+    prompt = f'''Convert each of the following {len(scripts)} Postman scripts to modern syntax, treating each INPUT independently according to its type.
+Return a single JSON array of strings where element i is the converted script for INPUT i, in the same order. Each string must be plain JavaScript only, with no additional comments, markdown, or explanation. Return nothing outside the JSON array.
+
+{inputs}
 '''
     payload = {
-        "systemprompt": "",
+        "systemprompt": SCRIPT_SYSTEM_PROMPT,
         "userprompt": prompt,
         "max_completion_tokens": 16000,
         "temperature": 0.15,
-        "message": chat_history + [{"role": "user", "content": prompt}],
-        "model": "gpt-4.1 mini"
+        "message": [{"role": "system", "content": SCRIPT_SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+        "model": SCRIPT_LLM_MODEL
     }
-    response = requests.post(api_url, json=payload, timeout=1600)
-    response.raise_for_status()
-    return response.text.strip().strip('`\n"\' ')
-
-def generate_postman_v22_again(oldpm_raw):
-    prompt = f"""
+    def complete(text):
+        try:
+            converted = salvage_partial_json(strip_fences(text), len(scripts))
+        except ValueError:
+            return False
+        return all(isinstance(script, str) and not is_truncated(strip_fences(script)) for script in converted)
+    response = strip_fences(post_llm(payload, timeout=SCRIPT_LLM_TIMEOUT, kind="batch", accept=complete))
+    converted = salvage_partial_json(response, len(scripts))
+    return [strip_fences(script) if isinstance(script, str) else None for script in converted]
+
+COLLECTION_PROMPT_PREFIX = """
 <|system|>
 You are a helpful assistant that corrects the format of the Postman v2.2.0 collection.
 
@@ -208,21 +451,45 @@ You are a helpful assistant that corrects the format of the Postman v2.2.0 colle
 Update this collection to Postman v2.2.0 with proper test scripts (pm.test, pm.expect, pm.response). Retain v2.1.0 in the schema string.
 
 ```json
-{oldpm_raw}
 """
+COLLECTION_PROMPT_SUFFIX = "\n"
+
+def generate_postman_v22_again(oldpm_raw):
+    prompt = COLLECTION_PROMPT_PREFIX + oldpm_raw + COLLECTION_PROMPT_SUFFIX
     payload = {
         "systemprompt": "",
         "userprompt": prompt,
         "max_completion_tokens": 16000,
         "temperature": 0.15,
-        "message": chat_history + [{"role": "user", "content": prompt}],
+        "message": SYSTEM_MESSAGES + [{"role": "user", "content": prompt}],
         "model": "gpt-4.1-mini"
     }
-    response = requests.post(api_url, json=payload, timeout=180)
-    response.raise_for_status()
-    fixed = response.text.strip().removeprefix("```json").removesuffix("```").strip()
+    fixed = strip_fences(post_llm(payload, timeout=COLLECTION_LLM_TIMEOUT, kind="collection"))
     return fixed
 
+def generate_postman_v22_again_batch(oldpm_raws):
+    inputs = "\n".join(f"INPUT {i}:\n```json\n{raw}\n```" for i, raw in enumerate(oldpm_raws))
+    prompt = f"""
+<|system|>
+You are a helpful assistant that corrects the format of Postman v2.2.0 collections.
+
+<|user|>
+Update each of the following {len(oldpm_raws)} collections to Postman v2.2.0 with proper test scripts (pm.test, pm.expect, pm.response). Retain v2.1.0 in the schema string.
+Return a single JSON array where element i is the corrected collection for INPUT i, in the same order, with nothing else around it.
+
+{inputs}
+"""
+    payload = {
+        "systemprompt": "",
+        "userprompt": prompt,
+        "max_completion_tokens": 16000,
+        "temperature": 0.15,
+        "message": SYSTEM_MESSAGES + [{"role": "user", "content": prompt}],
+        "model": "gpt-4.1-mini"
+    }
+    fixed = strip_fences(post_llm(payload, timeout=COLLECTION_LLM_TIMEOUT, kind="collection_batch"))
+    return salvage_partial_json(fixed, len(oldpm_raws))
+
 def fix_syntax_v22(truncated_script,old_script):
     prompt = f'''
 <|system|>
@@ -242,17 +509,14 @@ This is the truncated or incomplete Postman script that you need to continue fro
     payload = {
         "systemprompt": "",
         "userprompt": prompt,
-        "message": chat_history + [{"role": "user", "content": prompt}],
-        "model": "gpt-4.1 mini"
+        "max_completion_tokens": 16000,
+        "message": SYSTEM_MESSAGES + [{"role": "user", "content": prompt}],
+        "model": SCRIPT_LLM_MODEL
     }
-    response = requests.post(api_url, json=payload, timeout=3200)
-    response.raise_for_status()
-    return response.text.strip().strip('`\n"\' ')
+    return strip_fences(post_llm(payload, timeout=SCRIPT_LLM_TIMEOUT, kind="fix"))
 
-def generate_script_v22_fix(truncated_script, original_script, script_type):
-    prompt = f'''
-<|system|>
-You are a helpful and an excellent assistant that completes truncated or incomplete Postman {script_type} scripts by continuing right off from where the previous LLM's response ended. The previous LLM response was truncated or incomplete. Your job is to finish the script correctly, preserving all logic, function names, and structure from the original input.
+SCRIPT_FIX_SYSTEM_PROMPTS = {
+    script_type: f'''You are a helpful and an excellent assistant that completes truncated or incomplete Postman {script_type} scripts by continuing right off from where the previous LLM's response ended. The previous LLM response was truncated or incomplete. Your job is to finish the script correctly, preserving all logic, function names, and structure from the original input.
 
 Instructions:
 1. Do **not** rewrite the entire script.
@@ -268,91 +532,17 @@ where function_name and function_call are placeholders for the actual global fun
 
 ### Response structure:
 Assume all scripts reference a JSON structure like this (from `pm.response.json()`):
-{{
-  "code": 0,
-  "message": "success",
-  "data": {{
-    "summary_details": {{
-      "down_count": 2,
-      "downtime_duration": 120,
-      "availability_percentage": 99.5,
-      "mtbf": 300,
-      "unmanaged_duration": 10,
-      "alarm_count": 1,
-      "mttr": 60,
-      "maintenance_percentage": 0.5,
-      "maintenance_duration": 30,
-      "availability_duration": 7200,
-      "unmanaged_percentage": 0.2,
-      "downtime_percentage": 0.3,
-      "critical_percentage": 0.1,
-      "critical_count": 1,
-      "critical_duration": 50,
-      "trouble_percentage": 0.2,
-      "trouble_count": 1,
-      "trouble_duration": 70
-    }},
-    "charts": [
-      {{
-        "name": "Uptime Chart",
-        "data_points": [...]
-      }}
-    ],
-    "info": {{
-      "report_name": "Top N Report",
-      "report_type": 15,
-      "limit": 10,
-      "formatted_start_time": "2024-06-01 00:00:00",
-      "formatted_end_time": "2024-06-30 23:59:59",
-      "start_time": 1717200000000,
-      "end_time": 1719791999000,
-      "generated_time": 1719800000000,
-      "formatted_generated_time": "2024-07-01 00:00:00",
-      "timezone": "Asia/Kolkata",
-      "period": "Last Month",
-      "period_name": "June 2024",
-      "monitor_type": "HOMEPAGE"
-    }},
-    "availability_details": [
-      {{
-        "monitor_id": 12345,
-        "availability": 99.9
-      }}
-    ],
-    "outage_details": [
-      {{
-        "monitor_id": 12345,
-        "outages": [
-          {{
-            "outage_id": "out123",
-            "start_time": 1717500000000,
-            "end_time": 1717500600000,
-            "duration": 60,
-            "type": "critical"
-          }}
-        ]
-      }}
-    ],
-    "profile_details": {{
-      "profile_id": 987,
-      "profile_name": "Critical Monitors"
-    }},
-    "performance_details": {{
-      "HOMEPAGE": {{
-        "name": "Homepage Load",
-        "attribute_data": [...],
-        "availability": [...],
-        "tags": ["web", "latency"]
-      }}
-    }}
-  }}
-}}
+{RESPONSE_SHAPE_JSON}
 4. Use the structure above to correctly navigate nested properties. For example:
     - `data.summary_details.down_count` should be accessed via `response.summary_details.down_count`
     - Never use `response.down_count` directly unless it is top-level (which it isn't in this structure).
     - Always check if the parent (e.g., `summary_details`) exists before accessing its children.
+'''
+    for script_type in ("test", "prerequest")
+}
 
-<|user|>
+def generate_script_v22_fix(truncated_script, original_script, script_type):
+    prompt = f'''
 The following is a truncated or incomplete Postman {script_type} script (output from a previous LLM call):
 ---
 {truncated_script}
@@ -366,171 +556,368 @@ Here is the original input script that was supposed to be converted to the new f
 Please complete and repair the truncated output by appending from the end of the above truncated script the correct converted logic of the original script, returning the full, valid, and modernized Postman {script_type} script as plain JavaScript only. Do not add any extra comments, explanations, or markdown. Finally append your output to the input and check if it is a valid function before returning only your output.
 '''
     payload = {
-        "systemprompt": "",
+        "systemprompt": SCRIPT_FIX_SYSTEM_PROMPTS[script_type],
         "userprompt": prompt,
         "max_completion_tokens": 16000,
         "temperature": 0.15,
-        "message": chat_history + [{"role": "user", "content": prompt}],
-        "model": "gpt-4.1-mini"
+        "message": [{"role": "system", "content": SCRIPT_FIX_SYSTEM_PROMPTS[script_type]}, {"role": "user", "content": prompt}],
+        "model": SCRIPT_LLM_MODEL
     }
-    response = requests.post(api_url, json=payload, timeout=3200)
-    response.raise_for_status()
-    return response.text.strip().strip('`\n"\' ')
-
-def convert_scripts_in_collection(obj, parent_listen=None):
-    if isinstance(obj, dict):
-        if "event" in obj and isinstance(obj["event"], list):
-            for event in obj["event"]:
-                listen_type = event.get("listen", None)
-                if "script" in event:
-                    convert_scripts_in_collection(event, parent_listen=listen_type)
-        if "script" in obj and isinstance(obj["script"], dict) and "exec" in obj["script"]:
-            value = obj["script"]
-            old_exec = value["exec"]
-            if isinstance(old_exec, list) and all(line.strip() == "" for line in old_exec):
-                value["exec"] = []
-            else:
+    return strip_fences(post_llm(payload, timeout=SCRIPT_LLM_TIMEOUT, kind="fix"))
+
+def new_bracket_state():
+    return {"stack": [], "mode": None, "prev": "", "ok": True}
+
+def feed_brackets(state, s):
+    if not state["ok"] or not s:
+        return state
+    stack, mode = state["stack"], state["mode"]
+    prev, consumed = state["prev"], -1
+    for match in BRACKET_TOKEN_RE.finditer(s):
+        i = match.start()
+        c = s[i]
+        if i:
+            prev = "" if consumed == i - 1 else s[i - 1]
+        if mode == "//":
+            if c == "\n":
+                mode = None
+        elif mode == "/*":
+            if prev == "*" and c == "/":
+                mode, consumed = None, i
+        elif mode:
+            if prev == "\\":
+                consumed = i
+            elif c == mode:
+                mode = None
+        elif prev == "/" and c in "/*":
+            mode, consumed = "/" + c, i
+        elif c in "'\"`":
+            mode = c
+        elif c in "({[":
+            stack.append(c)
+        elif c in ")}]":
+            if not stack or stack[-1] != CLOSING_BRACKETS[c]:
+                state["ok"] = False
+                return state
+            stack.pop()
+    state["mode"] = mode
+    state["prev"] = "" if consumed == len(s) - 1 else s[-1]
+    return state
+
+def brackets_open(state):
+    return not state["ok"] or bool(state["stack"]) or state["mode"] not in (None, "//")
+
+def is_truncated(s):
+    return brackets_open(feed_brackets(new_bracket_state(), s))
+
+def rewrite_legacy_tests(script_text):
+    # Match on a copy with string and comment spans blanked out (newlines kept), so only
+    # tests[] lines that start in code are rewritten; the title literal is copied verbatim.
+    masked = STRING_OR_COMMENT_RE.sub(
+        lambda match: "\n".join("\0" * len(line) for line in match.group().split("\n")), script_text
+    )
+    rewritten, pos = [], 0
+    for match in LEGACY_TEST_RE.finditer(masked):
+        indent, name, expr = (script_text[match.start(i):match.end(i)] for i in (1, 2, 3))
+        rewritten.append(script_text[pos:match.start()] + LEGACY_TEST_REWRITE.format(indent, name, expr))
+        pos = match.end()
+    rewritten.append(script_text[pos:])
+    return "".join(rewritten)
+
+def convert_script_locally(script_text, script_type):
+    script_text = rewrite_legacy_tests(script_text)
+    pieces = STRING_OR_COMMENT_RE.split(script_text)
+    literals = [match.group() for match in STRING_OR_COMMENT_RE.finditer(script_text)]
+    rewritten = []
+    for code, literal in zip(pieces, literals + [""]):
+        if LEGACY_UNSUPPORTED_RE.search(code):
+            return None
+        for pattern, replacement in LEGACY_REWRITES:
+            code = pattern.sub(replacement, code)
+        if LEGACY_RE.search(code):
+            return None
+        rewritten.append(code + literal)
+    script_text = "".join(rewritten)
+    if is_truncated(script_text):
+        return None
+    if script_type == "prerequest" and "pm.response" in script_text:
+        return None
+    return script_text
+
+def convert_script(script_text, script_type):
+    cleaned_script = generate_script_v22(script_text, script_type)
+    brackets = feed_brackets(new_bracket_state(), cleaned_script)
+    if cleaned_script and brackets_open(brackets):
+        max_attempts = 7
+        attempts = 0
+        depth = len(brackets["stack"])
+        while brackets_open(brackets) and attempts < max_attempts:
+            new_script = generate_script_v22_fix(cleaned_script, script_text, script_type)
+            if not new_script:
+                break
+            cleaned_script += new_script
+            feed_brackets(brackets, new_script)
+            attempts += 1
+            previous_depth, depth = depth, len(brackets["stack"])
+            if not brackets["ok"] or depth >= previous_depth:
+                break
+        if brackets_open(brackets):
+            new_script = fix_syntax_v22(cleaned_script,script_text)
+            cleaned_script += new_script
+    return cleaned_script
+
+def collect_scripts(root):
+    jobs = []
+    stack = deque([(root, None)])
+    while stack:
+        obj, parent_listen = stack.pop()
+        if isinstance(obj, dict):
+            children = []
+            if "event" in obj and isinstance(obj["event"], list):
+                for event in obj["event"]:
+                    if isinstance(event, dict) and "script" in event:
+                        children.append((event, event.get("listen", None)))
+            if "script" in obj and isinstance(obj["script"], dict) and "exec" in obj["script"]:
+                value = obj["script"]
+                old_exec = value["exec"]
                 script_text = "\n".join(old_exec) if isinstance(old_exec, list) else str(old_exec)
-                try:
+                if not COMMENT_RE.sub("", script_text).strip():
+                    value["exec"] = []
+                elif LEGACY_RE.search(script_text):
                     script_type = parent_listen if parent_listen in ("prerequest", "test") else "test"
-                    new_script = generate_script_v22(script_text, script_type)
-                    cleaned_script = new_script.strip()
-                    for prefix in ["javascript", "js"]:
-                        if cleaned_script.lower().startswith(prefix):
-                            cleaned_script = cleaned_script[len(prefix):].lstrip(':').lstrip('\n').lstrip()
-                    def is_truncated(s):
-                        stack = []
-                        pairs = {')': '(', '}': '{', ']': '['}
-                        for c in s:
-                            if c in '({[':
-                                stack.append(c)
-                            elif c in ')}]':
-                                if not stack or stack[-1] != pairs[c]:
-                                    return True
-                                stack.pop()
-                        return bool(stack) 
-                    chat_history.append({"role": "assistant", "content": cleaned_script})
-                    if not cleaned_script:
-                        value["exec"] = []
-                    
-                    elif is_truncated(cleaned_script):
-                        max_attempts = 7
-                        attempts = 0
-                        while is_truncated(cleaned_script) and attempts < max_attempts:
-                            fixed_script = generate_script_v22_fix(cleaned_script, script_text, script_type)
-                            new_script = fixed_script.strip()
-                            for prefix in ["javascript", "js"]:
-                                if new_script.lower().startswith(prefix):
-                                    new_script = new_script[len(prefix):].lstrip(':').lstrip('\n').lstrip()
-                            cleaned_script += new_script
-                            chat_history.append({"role": "assistant", "content": cleaned_script})
-                            attempts += 1
-                        if is_truncated(cleaned_script):
-                            fixed_script = fix_syntax_v22(cleaned_script,script_text)
-                            new_script = fixed_script.strip()
-                            for prefix in ["javascript", "js"]:
-                                if new_script.lower().startswith(prefix):
-                                    new_script = new_script[len(prefix):].lstrip(':').lstrip('\n').lstrip()
-                            cleaned_script += new_script
-                            chat_history.append({"role": "assistant", "content": cleaned_script})
-                        value["exec"] = cleaned_script.splitlines() if cleaned_script else []
-                    else:
-                        value["exec"] = cleaned_script.splitlines()
-                except Exception as e:
-                    st.warning(f"Script conversion failed: {e}")
-        if "item" in obj and isinstance(obj["item"], list):
-            for subitem in obj["item"]:
-                convert_scripts_in_collection(subitem)
-        for key, value in obj.items():
-            if key not in ("event", "script", "item"):
-                convert_scripts_in_collection(value, parent_listen=parent_listen)
-    elif isinstance(obj, list):
-        for item in obj:
-            convert_scripts_in_collection(item, parent_listen=parent_listen)
+                    jobs.append((value, script_text, script_type))
+            if "item" in obj and isinstance(obj["item"], list):
+                children.extend((subitem, None) for subitem in obj["item"])
+            for key, value in obj.items():
+                if key not in ("event", "script", "item") and isinstance(value, (dict, list)):
+                    children.append((value, parent_listen))
+            stack.extend(reversed(children))
+        elif isinstance(obj, list):
+            stack.extend((item, parent_listen) for item in reversed(obj))
+    return jobs
+
+def convert_batch(batch):
+    try:
+        return generate_scripts_v22_batch([(script_text, script_type) for _, script_text, script_type in batch])
+    except Exception:
+        return [None] * len(batch)
+
+# Bump when editing the inline batch or repair prompt templates; the named prompts and model are hashed in.
+SCRIPT_PROMPT_VERSION = 1
+SCRIPT_CACHE_SALT = hashlib.blake2b(
+    "\0".join([
+        str(SCRIPT_PROMPT_VERSION),
+        SCRIPT_LLM_MODEL,
+        SCRIPT_SYSTEM_PROMPT,
+        *SCRIPT_PROMPT_PREFIXES.values(),
+        *SCRIPT_FIX_SYSTEM_PROMPTS.values(),
+    ]).encode("utf-8"),
+    digest_size=8,
+).hexdigest()
+
+def script_cache_key(script_text, script_type):
+    return hashlib.blake2b(
+        f"{SCRIPT_CACHE_SALT}\0{script_type}\0{script_text}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+def collect_unique_scripts(jobs):
+    unique = {}
+    slots = {}
+    for script_dict, script_text, script_type in jobs:
+        key = script_cache_key(script_text, script_type)
+        unique.setdefault(key, (script_text, script_type))
+        slots.setdefault(key, []).append(script_dict)
+    return unique, slots
+
+def apply_converted(slots, conversions):
+    for key, script in conversions.items():
+        lines = script.splitlines()
+        for script_dict in slots[key]:
+            script_dict["exec"] = list(lines)
+
+def lookup_script_conversions(keys):
+    found = {key: converted_scripts[key] for key in keys if key in converted_scripts}
+    missing = keys - found.keys()
+    if missing:
+        with LLM_CACHE_LOCK, shelve.open(SCRIPT_CACHE_PATH) as cache:
+            for key in missing:
+                entry = cache.get(key)
+                if entry and time.time() - entry[0] < LLM_CACHE_TTL_SECONDS:
+                    found[key] = converted_scripts[key] = entry[1]
+    return found
+
+def store_script_conversions(conversions):
+    conversions = {key: script for key, script in conversions.items() if not is_truncated(script)}
+    if not conversions:
+        return
+    converted_scripts.update(conversions)
+    now = time.time()
+    with LLM_CACHE_LOCK, shelve.open(SCRIPT_CACHE_PATH) as cache:
+        for key, script in conversions.items():
+            cache[key] = (now, script)
+
+def convert_scripts_in_collection(obj, warnings=None):
+    if warnings is None:
+        warnings = []
+    unique, slots = collect_unique_scripts(collect_scripts(obj))
+    converted = lookup_script_conversions(unique.keys())
+    pending_jobs = []
+    for key, (script_text, script_type) in unique.items():
+        if key in converted:
+            continue
+        local_script = convert_script_locally(script_text, script_type)
+        if local_script is not None:
+            converted[key] = local_script
+        else:
+            pending_jobs.append((key, script_text, script_type))
+    fresh = {}
+    batches = list(batched(pending_jobs, SCRIPT_BATCH_SIZE, SCRIPT_BATCH_MAX_CHARS, size=lambda job: len(job[1])))
+    with ThreadPoolExecutor(max_workers=SCRIPT_WORKERS) as executor:
+        fallback_jobs = []
+        for batch, batch_scripts in zip(batches, executor.map(convert_batch, batches)):
+            for job, cleaned_script in zip(batch, batch_scripts):
+                if isinstance(cleaned_script, str) and not is_truncated(cleaned_script):
+                    fresh[job[0]] = cleaned_script
+                else:
+                    fallback_jobs.append(job)
+        futures = [
+            executor.submit(convert_script, script_text, script_type)
+            for _, script_text, script_type in fallback_jobs
+        ]
+        retry_jobs = []
+        for job, future in zip(fallback_jobs, futures):
+            try:
+                fresh[job[0]] = future.result()
+            except TRANSIENT_LLM_ERRORS:
+                retry_jobs.append(job)
+            except requests.exceptions.HTTPError as e:
+                if e.response is None or e.response.status_code not in GLOBAL_LLM_ERROR_STATUSES:
+                    warnings.append(f"Script conversion failed: {e}")
+                    continue
+                for pending in futures:
+                    pending.cancel()
+                apply_converted(slots, converted | fresh)
+                store_script_conversions(fresh)
+                raise
+            except Exception as e:
+                warnings.append(f"Script conversion failed: {e}")
+    for job in retry_jobs:
+        try:
+            fresh[job[0]] = convert_script(job[1], job[2])
+        except Exception as e:
+            warnings.append(f"Script conversion failed after retrying: {e}")
+    converted.update(fresh)
+    apply_converted(slots, converted)
+    store_script_conversions(fresh)
+    return warnings
+
+
+def converted_name(file):
+    return f"{Path(file).stem}_converted.json"
+
+def convert_one(zip_ref, info):
+    file = os.path.basename(info.filename)
+    try:
+        raw = zip_ref.read(info)
+        collection_json = orjson.loads(raw)
+
+        if "item" not in collection_json:
+            return "skipped", f"{file} skipped: No 'item' key found.", None, []
+
+        warnings = []
+        if not is_already_v22(raw, collection_json):
+            try:
+                convert_scripts_in_collection(collection_json, warnings)
+                validate_as_v22_but_save_as_v21(collection_json)
+            except Exception as e:
+                return "invalid", e, collection_json, warnings
+
+        return "converted", None, orjson.dumps(collection_json, option=orjson.OPT_INDENT_2), warnings
+    except Exception as e:
+        return "failed", f"Failed to process {file}: {e}", None, []
 
 
 if uploaded_zip:
-    with tempfile.TemporaryDirectory() as tmpdir:
-        zip_path = os.path.join(tmpdir, "uploaded.zip")
-        with open(zip_path, "wb") as f:
-            f.write(uploaded_zip.read())
-
-        extract_dir = os.path.join(tmpdir, "unzipped")
-        os.makedirs(extract_dir, exist_ok=True)
-
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
+    with zipfile.ZipFile(uploaded_zip, "r") as zip_ref:
+        json_members = [
+            info for info in zip_ref.infolist()
+            if not info.is_dir()
+            and info.filename.endswith(".json")
+            and not info.filename.startswith("__MACOSX/")
+            and not os.path.basename(info.filename).startswith("._")
+        ]
 
-        st.success("Zip extracted. Starting script conversion...")
+        st.success("Zip opened. Starting script conversion...")
 
-        converted_dir = os.path.join(tmpdir, "converted")
-        os.makedirs(converted_dir, exist_ok=True)
         converted_files = 0
+        valid_files = {}
+        failed_files = []
+        messages = []
 
-        total_files = sum(1 for root, _, files in os.walk(extract_dir) for file in files if file.endswith(".json"))
+        total_files = len(json_members)
         progress_bar = st.progress(0)
         progress_text = st.empty()
         start_time = time.time()
+        last_progress_update = 0
         processed_files = 0
 
-        for root, _, files in os.walk(extract_dir):
-            for file in files:
-                if file.endswith(".json"):
-                    input_path = os.path.join(root, file)
-                    try:
-                        with open(input_path, "r", encoding="utf-8") as f:
-                            raw = f.read()
-                        collection_json = json.loads(raw)
-
-                        if "item" not in collection_json:
-                            st.warning(f"{file} skipped: No 'item' key found.")
-                            continue
-
-                        convert_scripts_in_collection(collection_json)
-                        validate_as_v22_but_save_as_v21(collection_json)
-
-                        out_path = os.path.join(converted_dir, f"{Path(file).stem}_converted.json")
-                        with open(out_path, "w", encoding="utf-8") as f:
-                            f.write(json.dumps(collection_json, indent=2))
-                        converted_files += 1
-                    except Exception as e:
-                        st.error(f"Failed to process {file}: {e}")
-                    processed_files += 1
-                    elapsed = time.time() - start_time
-                    avg_time = elapsed / processed_files if processed_files else 0
-                    files_left = total_files - processed_files
-                    est_time_left = int(avg_time * files_left)
-                    mins, secs = divmod(est_time_left, 60)
-                    progress = processed_files / total_files if total_files else 1
-                    eta = datetime.now() + timedelta(seconds=est_time_left)
-                    eta_str = eta.strftime('%H:%M:%S')
-                    progress_bar.progress(progress)
-                    progress_text.text(f"Processed {processed_files}/{total_files} files. Time left: {mins}m {secs}s. ETA: {eta_str}")
-                    time.sleep(0.01)
-                    
-
-        if converted_files == 0:
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        try:
+            futures = {
+                executor.submit(convert_one, zip_ref, info): info.filename
+                for info in json_members
+            }
+            for future in as_completed(futures):
+                status, message, result, warnings = future.result()
+                messages.extend((st.warning, warning) for warning in warnings)
+                if status == "converted":
+                    converted_files += 1
+                    valid_files[converted_name(futures[future])] = result
+                elif status == "invalid":
+                    failed_files.append((converted_name(futures[future]), orjson.dumps(result).decode("utf-8"), message))
+                elif status == "skipped":
+                    messages.append((st.warning, message))
+                else:
+                    messages.append((st.error, message))
+                processed_files += 1
+                now = time.time()
+                if processed_files < total_files and now - last_progress_update < PROGRESS_UPDATE_INTERVAL:
+                    continue
+                last_progress_update = now
+                elapsed = now - start_time
+                avg_time = elapsed / processed_files if processed_files else 0
+                files_left = total_files - processed_files
+                est_time_left = int(avg_time * files_left)
+                mins, secs = divmod(est_time_left, 60)
+                progress = processed_files / total_files if total_files else 1
+                eta = datetime.now() + timedelta(seconds=est_time_left)
+                eta_str = eta.strftime('%H:%M:%S')
+                progress_bar.progress(progress)
+                progress_text.text(f"Processed {processed_files}/{total_files} files. Time left: {mins}m {secs}s. ETA: {eta_str}")
+        finally:
+            # A Stop or rerun raises inside the loop above; drop queued files instead of draining them.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for show, message in messages:
+            show(message)
+
+        if converted_files == 0 and not failed_files:
             st.warning("No valid .json files were converted.")
         else:
-            valid_files = []
             invalid_files = []
-            for file in os.listdir(converted_dir):
-                file_path = os.path.join(converted_dir, file)
+            for batch in batched(failed_files, RETRY_BATCH_SIZE, RETRY_BATCH_MAX_CHARS, size=lambda entry: len(entry[1])):
                 try:
-                    with open(file_path, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                    validate_as_v22_but_save_as_v21(data)
-                    valid_files.append(file)
-                except Exception as e:
+                    fixed_batch = generate_postman_v22_again_batch([raw_json for _, raw_json, _ in batch])
+                except Exception:
+                    fixed_batch = [None] * len(batch)
+                for (file, raw_json, e), parsed in zip(batch, fixed_batch):
                     try:
-                        with open(file_path, "r", encoding="utf-8") as f:
-                            raw_json = f.read()
-                        fixed_json = generate_postman_v22_again(raw_json)
-                        parsed = json.loads(fixed_json)
-                        validate_as_v22_but_save_as_v21(parsed)
-                        with open(file_path, "w", encoding="utf-8") as f:
-                            f.write(json.dumps(parsed, indent=2))
-                        valid_files.append(file)
+                        try:
+                            validate_as_v22_but_save_as_v21(parsed)
+                        except Exception:
+                            parsed = orjson.loads(generate_postman_v22_again(raw_json))
+                            validate_as_v22_but_save_as_v21(parsed)
+                        valid_files[file] = orjson.dumps(parsed, option=orjson.OPT_INDENT_2)
                         st.info(f"{file} was fixed and validated on retry.")
                     except Exception as e2:
                         invalid_files.append((file, f"Initial error: {e}; Retry error: {e2}"))
@@ -541,10 +928,10 @@ if uploaded_zip:
                     st.info(f"{fname}: {err}")
             else:
                 zip_buffer = BytesIO()
-                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
-                    for file in valid_files:
-                        file_path = os.path.join(converted_dir, file)
-                        zipf.write(file_path, arcname=file)
+                with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as zipf:
+                    for file, data in valid_files.items():
+                        compress_type = zipfile.ZIP_STORED if len(data) < ZIP_STORE_MAX_BYTES else None
+                        zipf.writestr(file, data, compress_type=compress_type)
                 zip_buffer.seek(0)
 
                 st.markdown("---")